@@ -0,0 +1,301 @@
+# llm_cache.py
+"""
+Cache exato de respostas dos LLMs locais.
+
+A saída de um LLM é função de (modelo, opções de geração, prompt); repetir a
+mesma pergunta (reload do Streamlit, demo, desenvolvimento) devolve o texto
+salvo em disco em micro-segundos em vez de pagar a inferência de novo.
+
+• cached_invoke / cached_ainvoke         — texto livre (`.content`)
+• cached_stream                          — texto livre em streaming
+• cached_structured / cached_astructured — saída estruturada (Pydantic)
+• SemanticCache                          — respostas por similaridade de
+                                          embedding (perguntas parafraseadas)
+
+O cache fica em `LLM_CACHE_DIR` (padrão `.llm_cache/`) e pode ser
+desligado com `LLM_CACHE=0`.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Iterator, Optional, Sequence, Type, TypeVar
+
+import numpy as np
+from pydantic import BaseModel, ValidationError
+
+if TYPE_CHECKING:  # só anotações: importar o LangChain aqui puxaria o langsmith
+    from langchain_ollama import ChatOllama
+
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+M = TypeVar("M", bound=BaseModel)
+
+
+# --------------------------------------------------------------------------- #
+# Armazenamento                                                               #
+# --------------------------------------------------------------------------- #
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """Conexão SQLite (WAL) compartilhada entre threads, criando o diretório."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+class PromptCache:
+    """
+    Mapa chave → texto persistido em SQLite, seguro entre threads.
+
+    O arquivo só é aberto no primeiro uso: importar o módulo não cria nada
+    em disco.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        # chamar com o lock
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock, self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+
+
+class SemanticCache:
+    """
+    Valores JSON indexados pelo embedding normalizado de um texto.
+
+    `get` devolve o valor mais próximo, entre as entradas ainda válidas,
+    se o cosseno passar de `threshold`. A busca é força bruta (produto
+    interno sobre a matriz inteira em numpy) — o equivalente a um
+    `IndexFlatIP`, rápido de sobra para as poucas milhares de entradas de
+    uso local e sem depender do FAISS.
+
+    Entradas com `ttl` expiram: ficam fora da busca e são apagadas (do
+    SQLite e da matriz) na carga e a cada `add`.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.92):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._values: list[str] = []
+        self._expires = np.empty(0, dtype=np.float64)
+        self._matrix: np.ndarray | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        """Abre o arquivo e carrega a matriz no primeiro uso (chamar com o lock)."""
+        if self._conn is not None:
+            return self._conn
+        conn = open_sqlite(self.path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, vec BLOB NOT NULL, value TEXT NOT NULL, "
+            "expires_at REAL)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+        if "expires_at" not in columns:  # arquivos anteriores à expiração
+            conn.execute("ALTER TABLE entries ADD COLUMN expires_at REAL")
+        with conn:
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        rows = conn.execute(
+            "SELECT vec, value, expires_at FROM entries ORDER BY id"
+        ).fetchall()
+        self._values = [value for _, value, _ in rows]
+        # sem TTL = nunca expira
+        self._expires = np.array(
+            [np.inf if exp is None else exp for _, _, exp in rows], dtype=np.float64
+        )
+        self._matrix = (
+            np.vstack([np.frombuffer(vec, dtype=np.float32) for vec, _, _ in rows])
+            if rows else None
+        )
+        self._conn = conn
+        return conn
+
+    @staticmethod
+    def _normalize(vec: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def get(self, vec: Sequence[float]) -> Optional[Any]:
+        q = self._normalize(vec)
+        with self._lock:
+            self._db()
+            if self._matrix is None:
+                return None
+            scores = self._matrix @ q
+            scores[self._expires <= time.time()] = -np.inf
+            # empates ficam com a entrada mais recente
+            best = len(scores) - 1 - int(np.argmax(scores[::-1]))
+            if scores[best] < self.threshold:
+                return None
+            return json.loads(self._values[best])
+
+    def _prune(self, now: float) -> None:
+        """Apaga as entradas expiradas (chamar com o lock e a transação abertos)."""
+        alive = self._expires > now
+        if alive.all():
+            return
+        self._db().execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        self._values = [v for v, keep in zip(self._values, alive) if keep]
+        self._expires = self._expires[alive]
+        self._matrix = self._matrix[alive] if alive.any() else None
+
+    def add(self, vec: Sequence[float], value: Any, ttl: Optional[float] = None) -> None:
+        q = self._normalize(vec)
+        text = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        with self._lock, self._db() as conn:
+            self._prune(now)
+            conn.execute(
+                "INSERT INTO entries (vec, value, expires_at) VALUES (?, ?, ?)",
+                (q.tobytes(), text, expires_at),
+            )
+            self._matrix = q[None, :] if self._matrix is None else np.vstack([self._matrix, q])
+            self._values.append(text)
+            self._expires = np.append(self._expires, np.inf if expires_at is None else expires_at)
+
+
+cache = PromptCache(os.path.join(CACHE_DIR, "prompts.sqlite"))
+
+
+# Campos do ChatOllama que mudam o texto gerado (`num_ctx` menor trunca o
+# prompt, por exemplo). Ficam de fora os que só afetam desempenho
+# (num_gpu, num_thread, keep_alive).
+_GENERATION_OPTIONS = (
+    "format", "mirostat", "mirostat_eta", "mirostat_tau", "num_ctx",
+    "num_predict", "repeat_last_n", "repeat_penalty", "seed", "stop",
+    "temperature", "tfs_z", "top_k", "top_p",
+)
+
+
+def _key(llm: ChatOllama, prompt: str, kind: str = "text") -> str:
+    """SHA-256 de tudo que influencia a resposta do modelo."""
+    options = {name: getattr(llm, name, None) for name in _GENERATION_OPTIONS}
+    raw = f"{kind}|{llm.model}|{json.dumps(options, sort_keys=True, default=str)}|{prompt}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# --------------------------------------------------------------------------- #
+# Wrappers de invocação                                                       #
+# --------------------------------------------------------------------------- #
+
+def cached_invoke(llm: ChatOllama, prompt: str) -> str:
+    """`llm.invoke(prompt).content` com cache exato."""
+    if not CACHE_ENABLED:
+        return llm.invoke(prompt).content
+
+    key = _key(llm, prompt)
+    if (hit := cache.get(key)) is not None:
+        return hit
+    out = llm.invoke(prompt).content
+    cache.set(key, out)
+    return out
+
+
+async def cached_ainvoke(llm: ChatOllama, prompt: str) -> str:
+    """Versão assíncrona de `cached_invoke`."""
+    if not CACHE_ENABLED:
+        return (await llm.ainvoke(prompt)).content
+
+    key = _key(llm, prompt)
+    if (hit := cache.get(key)) is not None:
+        return hit
+    out = (await llm.ainvoke(prompt)).content
+    cache.set(key, out)
+    return out
+
+
+def cached_stream(llm: ChatOllama, prompt: str) -> Iterator[str]:
+    """
+    `llm.stream(prompt)` (pedaços de `.content`) com cache exato.
+
+    Em cache hit o texto inteiro sai de uma vez; no miss os pedaços são
+    repassados à medida que chegam e o texto só é gravado ao final.
+    Compartilha a chave com `cached_invoke`.
+    """
+    key = _key(llm, prompt)
+    if CACHE_ENABLED and (hit := cache.get(key)) is not None:
+        yield hit
+        return
+
+    parts: list[str] = []
+    for chunk in llm.stream(prompt):
+        parts.append(chunk.content)
+        yield chunk.content
+    if CACHE_ENABLED:
+        cache.set(key, "".join(parts))
+
+
+@functools.lru_cache(maxsize=None)
+def _schema_kind(schema: Type[BaseModel]) -> str:
+    """Nome + hash do JSON Schema: mudar o modelo invalida as entradas antigas."""
+    spec = json.dumps(schema.model_json_schema(), sort_keys=True)
+    return f"{schema.__name__}:{hashlib.sha256(spec.encode()).hexdigest()[:16]}"
+
+
+def _load_structured(schema: Type[M], hit: Optional[str]) -> Optional[M]:
+    """Valida uma entrada do cache; inválida conta como miss (e é sobrescrita)."""
+    if hit is None:
+        return None
+    try:
+        return schema.model_validate_json(hit)
+    except ValidationError:
+        return None
+
+
+def cached_structured(llm: ChatOllama, schema: Type[M], prompt: str) -> M:
+    """`llm.with_structured_output(schema).invoke(prompt)` com cache exato (JSON)."""
+    if not CACHE_ENABLED:
+        return llm.with_structured_output(schema).invoke(prompt)
+
+    key = _key(llm, prompt, kind=_schema_kind(schema))
+    if (hit := _load_structured(schema, cache.get(key))) is not None:
+        return hit
+    out = llm.with_structured_output(schema).invoke(prompt)
+    cache.set(key, out.model_dump_json())
+    return out
+
+
+async def cached_astructured(llm: ChatOllama, schema: Type[M], prompt: str) -> M:
+    """Versão assíncrona de `cached_structured`."""
+    if not CACHE_ENABLED:
+        return await llm.with_structured_output(schema).ainvoke(prompt)
+
+    key = _key(llm, prompt, kind=_schema_kind(schema))
+    if (hit := _load_structured(schema, cache.get(key))) is not None:
+        return hit
+    out = await llm.with_structured_output(schema).ainvoke(prompt)
+    cache.set(key, out.model_dump_json())
+    return out
@@ -4,9 +4,12 @@ perplexity.py  —  Streamlit + LangGraph + LLMs locais (Ollama)
 Fluxo:
 
     1) build_first_queries   → gera 3-5 queries sobre a pergunta do usuário
-    2) serial_search         → executa cada query no Tavily, sintetiza via LLM
-                               e acumula QueryResult (tudo em série = sem conflito)
-    3) final_writer          → compila resposta final e referências
+    2) serial_search         → executa as queries no Tavily em paralelo
+                               (asyncio.gather), baixa as páginas da origem
+                               e sintetiza todos os resultados numa única
+                               chamada ao LLM
+    3) final_writer          → monta o prompt final e as referências;
+                               a UI gera a resposta em streaming
 """
 
 from __future__ import annotations
@@ -14,140 +17,338 @@ from __future__ import annotations
 # --------------------------------------------------------------------------- #
 # Imports                                                                     #
 # --------------------------------------------------------------------------- #
-from typing import List, Dict
+import asyncio
+import logging
+import os
+from dataclasses import asdict
+import subprocess
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, Iterator, List, Tuple
 import streamlit as st
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
 from langgraph.graph import START, END, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 from langchain_ollama import ChatOllama
 
-from schemas import ReportState, QueryResult
+from schemas import BatchSummaries, ReportState, QueryResult
 from prompts import (
     build_queries,
-    resume_search,
+    resume_search_batch,
     build_final_response,
 )
-from utils import tavily_search
+from utils import (
+    EMBED_MODEL,
+    clean_and_truncate,
+    dedupe_results,
+    drop_near_duplicates,
+    embed_batch,
+    fetch_page_text_async,
+    ollama_installed_models,
+    ollama_preload,
+    run_async,
+    tavily_search_async,
+)
+from llm_cache import (
+    CACHE_DIR,
+    SemanticCache,
+    cached_astructured,
+    cached_stream,
+)
 
 # --------------------------------------------------------------------------- #
 # Config                                                                      #
 # --------------------------------------------------------------------------- #
 load_dotenv()  # lê variáveis do .env
 
-# LLM que gera as queries e faz mini-resumos de resultados
-planner_llm = ChatOllama(model="llama3:8b-instruct-q4_K_S")
+# Mensagens de debug só são formatadas com o nível em DEBUG (?debug=1 na URL)
+log = logging.getLogger("perplexity")
+if not log.handlers:
+    log.addHandler(logging.StreamHandler())
+log.setLevel(logging.WARNING)
+
+# Tempo que o Ollama mantém cada modelo residente após o último uso
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_PREWARM = os.getenv("OLLAMA_PREWARM", "1") != "0"
+OLLAMA_MAX_LOADED_MODELS = int(os.getenv("OLLAMA_MAX_LOADED_MODELS", "0"))  # 0 = automático
+KEEP_WARM_INTERVAL = 25 * 60
 
-# LLM que escreve a resposta final longa
-reasoning_llm = ChatOllama(model="deepseek-r1:14b")
+REASONING_MODEL = "deepseek-r1:14b"
+# Resposta de 500-800 palavras (~1100 tokens) + o raciocínio <think> do R1;
+# a entrada são só os resumos + referências (< 1k tokens). KV-cache menor
+# que o padrão = decodificação mais rápida em hardware limitado por banda.
+REASONING_NUM_CTX = 4096
+REASONING_NUM_PREDICT = 2048
+
+# Planner: gerar queries e resumir páginas são tarefas curtas; um 1B basta.
+# Tag sem quantização explícita, usada se a quantizada não estiver instalada
+PLANNER_FALLBACK = "llama3.2:1b"
+# Contexto comporta o lote de resultados do resumo em uma chamada só.
+PLANNER_NUM_CTX = 4096
+PLANNER_NUM_PREDICT = 512  # geração de queries; o resumo em lote calcula a sua
+# Tokens do contexto reservados às instruções do prompt de resumo; o resto
+# (menos a saída) é dividido entre as páginas do lote
+SUMMARY_PROMPT_OVERHEAD = 400
+# Saída do resumo em lote: ~100 palavras por fonte + a moldura do JSON.
+# Dimensionada pelo tamanho do lote — JSON cortado invalida todos os resumos.
+SUMMARY_TOKENS_PER_SOURCE = 150
+SUMMARY_JSON_OVERHEAD = 64
+MAX_TOKENS_PER_SOURCE = 1_500
+MIN_TOKENS_PER_SOURCE = 128
+# O prompt pede 3-5 queries; o orçamento de contexto acima conta com isso
+MAX_QUERIES = 5
+# Páginas diferentes com o mesmo texto (espelhos) são resumidas uma vez só;
+# cosseno a partir do qual duas páginas contam como o mesmo conteúdo
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_DETECTION", "0") == "1"
+NEAR_DUP_THRESHOLD = 0.95
+
+
+@st.cache_resource
+def select_planner_model() -> str:
+    """
+    Escolhe a quantização do planner conforme o hardware.
+
+    Decodificação local é limitada pela banda de memória (cada token lê
+    todos os pesos), então metade dos bytes ≈ metade do tempo por token:
+    - Q4_K_M: padrão em CPU, Apple Silicon e GPUs pequenas
+    - Q8_0:   GPU com ≥16 GB de VRAM, onde a banda sobra e a qualidade
+              extra do 8-bit sai quase de graça
+
+    `PLANNER_MODEL` no ambiente sobrepõe a escolha. Se a tag quantizada
+    não estiver instalada mas `llama3.2:1b` estiver, usa esta última em
+    vez de falhar em silêncio a cada chamada do planner.
+    """
+    if model := os.getenv("PLANNER_MODEL"):
+        return model
+    try:
+        out = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout
+        vram_mb = max(int(line) for line in out.split())
+    except (OSError, subprocess.SubprocessError, ValueError):
+        vram_mb = 0  # sem GPU NVIDIA (CPU / Apple Silicon)
+    preferred = (
+        "llama3.2:1b-instruct-q8_0" if vram_mb >= 16 * 1024
+        else "llama3.2:1b-instruct-q4_K_M"
+    )
+    installed = ollama_installed_models()
+    if installed and preferred not in installed and PLANNER_FALLBACK in installed:
+        log.warning(
+            "%s não instalado; usando %s (rode `ollama pull %s`).",
+            preferred, PLANNER_FALLBACK, preferred,
+        )
+        return PLANNER_FALLBACK
+    return preferred
+
+
+# Recursos com embeddings (exigem `ollama pull nomic-embed-text`) ficam
+# desligados por padrão: com OLLAMA_MAX_LOADED_MODELS=1 cada pergunta
+# trocaria o modelo residente várias vezes.
+#
+# Cache semântico de respostas: perguntas parafraseadas reaproveitam a
+# resposta anterior (1 embedding + 1 produto interno no lugar do grafo todo)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+# Perguntas curtas e diretas usam queries de template, sem chamar o planner
+QUERY_HEURISTICS = os.getenv("QUERY_HEURISTICS", "1") != "0"
+SHORT_QUESTION_WORDS = 6
 
 # --------------------------------------------------------------------------- #
 # Nós do grafo                                                                #
 # --------------------------------------------------------------------------- #
-def build_first_queries(state: ReportState) -> Dict[str, List[str]]:
+async def build_first_queries(
+    state: ReportState, *, planner_llm: ChatOllama
+) -> Dict[str, List[str]]:
     """Planeja 3-5 queries a partir da pergunta do usuário."""
     class QueryList(BaseModel):
         queries: List[str]
 
+    question = state.user_input
+    if (
+        QUERY_HEURISTICS
+        and "?" in question
+        and len(question.split()) <= SHORT_QUESTION_WORDS
+    ):
+        topic = question.rstrip("?").strip()
+        queries = [question, f"{topic} explained", f"{topic} overview"]
+        log.debug("Queries de template: %s", queries)
+        return {"queries": queries}
+
     prompt = build_queries.format(user_input=state.user_input)
     
     try:
-        queries = (
-            planner_llm
-            .with_structured_output(QueryList)
-            .invoke(prompt)
-            .queries
-        )
-        print(f"Queries geradas: {queries}")  # Debug
+        queries = (await cached_astructured(planner_llm, QueryList, prompt)).queries
+        queries = queries[:MAX_QUERIES]
+        log.debug("Queries geradas: %s", queries)
         return {"queries": queries}
     except Exception as e:
-        print(f"Erro ao gerar queries: {e}")
+        log.warning("Erro ao gerar queries: %s", e)
         # Fallback com queries básicas
         return {"queries": [state.user_input]}
 
 
-def serial_search(state: ReportState) -> Dict[str, List[QueryResult]]:
+async def parallel_search(
+    state: ReportState, *, planner_llm: ChatOllama
+) -> Dict[str, List[QueryResult]]:
     """
-    Executa as queries em série (evita concorrência).
-    Para cada resultado, produz um QueryResult.
+    Executa as buscas no Tavily em paralelo (asyncio.gather) e sintetiza
+    todos os resultados numa única chamada ao planner (um prefill só,
+    em vez de uma chamada por query).
     """
-    collected: List[QueryResult] = []
-    
-    print(f"Executando busca para {len(state.queries)} queries")  # Debug
+    log.debug("Executando busca para %d queries", len(state.queries))
 
-    for i, q in enumerate(state.queries):
-        print(f"Buscando query {i+1}: {q}")  # Debug
-        
-        try:
-            tavily_resp = tavily_search(q, max_results=1, include_raw_content=True)
-            if not tavily_resp.get("results"):
-                print(f"Nenhum resultado para query: {q}")
-                continue
+    async def search_one(q: str) -> dict | None:
+        log.debug("Buscando query: %s", q)
 
-            r = tavily_resp["results"][0]
-            raw = r.get("raw_content") or r["content"]
+        # Tavily só com URLs/trechos (rápido); a página vem direto da origem
+        tavily_resp = await tavily_search_async(
+            q, max_results=1, include_raw_content=False
+        )
+        if not tavily_resp.get("results"):
+            log.debug("Nenhum resultado para query: %s", q)
+            return None
 
-            synth_prompt = resume_search.format(
-                user_input=state.user_input,
-                search_results=raw,
-            )
-            
-            summary = planner_llm.invoke(synth_prompt).content
+        r = tavily_resp["results"][0]
+        page = await fetch_page_text_async(r["url"])
+        return {**r, "raw_content": page} if page else r
 
-            query_result = QueryResult(
-                title=r["title"], 
-                url=r["url"], 
-                resume=summary
-            )
-            collected.append(query_result)
-            print(f"Resultado processado: {query_result.title}")  # Debug
-            
-        except Exception as e:
-            print(f"Erro ao processar query '{q}': {e}")
+    responses = await asyncio.gather(
+        *(search_one(q) for q in state.queries),
+        return_exceptions=True,
+    )
+
+    found: List[dict] = []
+    for q, res in zip(state.queries, responses):
+        if isinstance(res, Exception):
+            log.warning("Erro ao processar query '%s': %s", q, res)
             continue
+        if res is not None:
+            found.append(res)
 
-    print(f"Total de resultados coletados: {len(collected)}")  # Debug
+    # Queries diferentes costumam cair na mesma página: resume cada uma só uma vez
+    found = dedupe_results(found)
+    if not found:
+        return {"queries_results": []}
+
+    # ...ou em páginas diferentes com o mesmo texto: um /api/embed para todas
+    if NEAR_DUP_ENABLED and len(found) > 1:
+        try:
+            vectors = await asyncio.to_thread(embed_batch, [
+                clean_and_truncate(r.get("raw_content") or r["content"], 512)
+                for r in found
+            ])
+            found = drop_near_duplicates(found, vectors, NEAR_DUP_THRESHOLD)
+        except Exception as e:
+            log.warning("Detecção de quase-duplicatas indisponível: %s", e)
+
+    # Páginas limpas e cortadas para o lote inteiro (entrada + saída) caber
+    # no num_ctx do planner
+    summary_num_predict = SUMMARY_JSON_OVERHEAD + SUMMARY_TOKENS_PER_SOURCE * len(found)
+    summary_llm = planner_llm.model_copy(update={"num_predict": summary_num_predict})
+    tokens_per_source = max(MIN_TOKENS_PER_SOURCE, min(
+        MAX_TOKENS_PER_SOURCE,
+        (PLANNER_NUM_CTX - summary_num_predict - SUMMARY_PROMPT_OVERHEAD) // len(found),
+    ))
+    synth_prompt = resume_search_batch.format(
+        user_input=state.user_input,
+        search_results="".join(
+            f"[{idx}]\nTitle: {r['title']}\nURL: {r['url']}\n"
+            f"Content: {clean_and_truncate(r.get('raw_content') or r['content'], tokens_per_source)}"
+            f"\n----------------\n"
+            for idx, r in enumerate(found, start=1)
+        ),
+    )
+
+    try:
+        batch = await cached_astructured(summary_llm, BatchSummaries, synth_prompt)
+        summaries = {s.idx: s.summary for s in batch.summaries}
+    except Exception as e:
+        log.warning("Erro ao sintetizar resultados: %s", e)
+        summaries = {}
+
+    # Sem síntese para um índice → usa o trecho curto do próprio Tavily
+    collected = [
+        QueryResult(
+            title=r["title"],
+            url=r["url"],
+            resume=summaries.get(idx) or r["content"],
+        )
+        for idx, r in enumerate(found, start=1)
+    ]
+
+    log.debug("Total de resultados coletados: %d", len(collected))
     return {"queries_results": collected}
 
 
-def final_writer(state: ReportState) -> Dict[str, str]:
-    """Gera resposta final longa + referências."""
-    print(f"Gerando resposta final com {len(state.queries_results)} resultados")  # Debug
+async def final_writer(state: ReportState) -> Dict[str, str]:
+    """
+    Monta o prompt da resposta final + referências.
+
+    A geração em si acontece em streaming na UI (`main`), para o texto
+    aparecer token a token em vez de só depois da resposta inteira.
+    Assíncrono só para o `ainvoke` não despachar o nó para uma thread.
+    """
+    log.debug("Gerando resposta final com %d resultados", len(state.queries_results))
     
     if not state.queries_results:
         return {"final_response": "Não foi possível encontrar informações relevantes para sua pergunta."}
     
-    body_parts, ref_parts = [], []
-
-    for idx, res in enumerate(state.queries_results, start=1):
-        body_parts.append(
-            f"[{idx}]\nTitle: {res.title}\nURL: {res.url}\n"
-            f"Content: {res.resume}\n----------------\n"
-        )
-        ref_parts.append(f"[{idx}] - [{res.title}]({res.url})")
+    indexed = list(enumerate(state.queries_results, start=1))
+    body = "".join(
+        f"[{idx}]\nTitle: {res.title}\nURL: {res.url}\n"
+        f"Content: {res.resume}\n----------------\n"
+        for idx, res in indexed
+    )
+    references = "\n".join(f"[{idx}] - [{res.title}]({res.url})" for idx, res in indexed)
 
     prompt = build_final_response.format(
         user_input=state.user_input,
-        search_results="".join(body_parts),
+        search_results=body,
     )
-    
-    try:
-        final_text = reasoning_llm.invoke(prompt).content
-        full_answer = f"{final_text}\n\nReferences:\n" + "\n".join(ref_parts)
-        return {"final_response": full_answer}
-    except Exception as e:
-        print(f"Erro ao gerar resposta final: {e}")
-        return {"final_response": f"Erro ao gerar resposta: {str(e)}"}
+    return {"final_prompt": prompt, "references": references}
 
 
 # --------------------------------------------------------------------------- #
 # Construção do grafo                                                         #
 # --------------------------------------------------------------------------- #
-def create_graph():
-    """Cria e retorna o grafo compilado."""
+@st.cache_resource
+def build_pipeline(
+    planner_model: str, reasoning_model: str
+) -> Tuple[ChatOllama, ChatOllama, CompiledStateGraph]:
+    """
+    Cria os clientes LLM e o grafo compilado para um par de modelos.
+
+    O cache é chaveado pelos nomes dos modelos: reruns do Streamlit
+    reaproveitam tudo, e trocar de modelo cria (uma vez) um pipeline novo
+    em vez de deixar o grafo preso a clientes antigos.
+
+    Returns: (planner_llm, reasoning_llm, graph)
+    """
+    # Gera as queries e faz mini-resumos de resultados
+    planner_llm = ChatOllama(
+        model=planner_model,
+        temperature=0.1,
+        top_p=0.9,
+        num_predict=PLANNER_NUM_PREDICT,
+        num_ctx=PLANNER_NUM_CTX,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+    )
+    # Escreve a resposta final longa (em streaming, fora do grafo)
+    reasoning_llm = ChatOllama(
+        model=reasoning_model,
+        num_predict=REASONING_NUM_PREDICT,
+        num_ctx=REASONING_NUM_CTX,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+    )
+
     builder = StateGraph(ReportState)
-    builder.add_node("build_queries", build_first_queries)
-    builder.add_node("serial_search", serial_search)
+    builder.add_node("build_queries", partial(build_first_queries, planner_llm=planner_llm))
+    builder.add_node("serial_search", partial(parallel_search, planner_llm=planner_llm))
     builder.add_node("final_writer", final_writer)
 
     builder.add_edge(START, "build_queries")
@@ -155,9 +356,88 @@ def create_graph():
     builder.add_edge("serial_search", "final_writer")
     builder.add_edge("final_writer", END)
 
-    return builder.compile()
+    return planner_llm, reasoning_llm, builder.compile()
+
+
+class KeepWarm:
+    """
+    Re-pinga os modelos a cada `KEEP_WARM_INTERVAL` s, antes do keep-alive
+    de 30 min expirar, para o Ollama não descarregá-los.
+
+    • Só pinga o que pode ficar residente: com OLLAMA_MAX_LOADED_MODELS=1
+      apenas o planner (é ele que a próxima pergunta usa primeiro);
+      carregar o 14B só para o planner despejá-lo em seguida é desperdício.
+    • Não pinga enquanto houver pergunta em andamento (`busy()`), para não
+      trocar o modelo residente no meio de uma resposta.
+    • `start` com outros modelos encerra a thread anterior (Event), em vez
+      de deixar threads eternas acumulando.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._models: Tuple[str, ...] = ()
+
+    def start(self, models: Tuple[str, ...]) -> None:
+        with self._lock:
+            if models == self._models and self._thread and self._thread.is_alive():
+                return
+            self._stop.set()
+            self._stop = stop = threading.Event()
+            self._models = models
+            self._thread = threading.Thread(
+                target=self._run, args=(models, stop), name="ollama-keep-warm", daemon=True
+            )
+            self._thread.start()
 
-graph = create_graph()
+    def stop(self) -> None:
+        self._stop.set()
+
+    @contextmanager
+    def busy(self) -> Iterator[None]:
+        with self._lock:
+            self._busy += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._busy -= 1
+
+    def _run(self, models: Tuple[str, ...], stop: threading.Event) -> None:
+        while not stop.is_set():
+            for model in models:
+                if self._busy or stop.is_set():
+                    break
+                try:
+                    ollama_preload(model, OLLAMA_KEEP_ALIVE)
+                except Exception as e:
+                    log.warning("Erro ao pré-carregar %s: %s", model, e)
+            stop.wait(KEEP_WARM_INTERVAL)
+
+
+def resident_models(planner_model: str, reasoning_model: str) -> Tuple[str, ...]:
+    """Modelos que cabem residentes ao mesmo tempo, o planner por último."""
+    if OLLAMA_MAX_LOADED_MODELS == 1:
+        return (planner_model,)
+    return (reasoning_model, planner_model)
+
+
+@st.cache_resource
+def get_keep_warm() -> KeepWarm:
+    # uma instância por processo: sobrevive aos reruns do script
+    return KeepWarm()
+
+
+@st.cache_resource
+def get_answer_cache() -> SemanticCache:
+    # um arquivo por modelo de embedding (dimensões diferentes não se misturam)
+    name = EMBED_MODEL.replace(":", "_").replace("/", "_")
+    return SemanticCache(
+        os.path.join(CACHE_DIR, f"answers-{name}.sqlite"),
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+    )
 
 # --------------------------------------------------------------------------- #
 # Streamlit UI                                                                #
@@ -166,30 +446,72 @@ def main():
     st.set_page_config(page_title="Local Perplexity")
     st.title("🌎 Local Perplexity")
 
+    log.setLevel(
+        logging.DEBUG if st.query_params.get("debug") == "1" else logging.WARNING
+    )
+
+    planner_model = select_planner_model()
+    _, reasoning_llm, graph = build_pipeline(planner_model, REASONING_MODEL)
+    keep_warm = get_keep_warm()
+    if OLLAMA_PREWARM:
+        keep_warm.start(resident_models(planner_model, REASONING_MODEL))
+
     question = st.text_input(
         "Qual a sua pergunta?",
         value="How is the process of building an LLM?"
     )
 
     if st.button("Pesquisar") and question.strip():
-        with st.status("Gerando resposta…") as status:
+        with st.status("Gerando resposta…") as status, keep_warm.busy():
             try:
+                # Cache semântico: pergunta parecida já respondida?
+                q_vec, hit = None, None
+                if SEMANTIC_CACHE_ENABLED:
+                    try:
+                        q_vec = embed_batch([question.strip()])[0]
+                        hit = get_answer_cache().get(q_vec)
+                    except Exception as e:
+                        log.warning("Cache semântico indisponível: %s", e)
+
+                if hit:
+                    status.update(label="Resposta do cache!", state="complete")
+                    st.markdown(hit["final_response"])
+                    return
+
                 # Estado inicial
                 initial_state = ReportState(user_input=question.strip())
                 
                 # Debug
                 st.write("Executando busca...")
                 
-                # Executa o grafo
-                result_state = graph.invoke(initial_state.dict())
+                # Executa o grafo (todos os nós são assíncronos)
+                result_state = run_async(graph.ainvoke(initial_state.model_dump()))
                 
-                status.update(label="Resposta gerada!", state="complete")
-                
-                # Exibe resultado
-                if result_state.get("final_response"):
-                    st.markdown(result_state["final_response"])
+                # Resposta final em streaming (tokens aparecem à medida que chegam)
+                if result_state.get("final_prompt"):
+                    final_text = st.write_stream(
+                        cached_stream(reasoning_llm, result_state["final_prompt"])
+                    )
+                    references = f"References:\n{result_state['references']}"
+                    st.markdown(references)
+                    final_response = f"{final_text}\n\n{references}"
                 else:
-                    st.error("Nenhuma resposta foi gerada.")
+                    final_response = result_state.get("final_response", "")
+                    if final_response:
+                        st.markdown(final_response)
+                    else:
+                        st.error("Nenhuma resposta foi gerada.")
+
+                status.update(label="Resposta gerada!", state="complete")
+
+                if q_vec is not None and result_state.get("queries_results"):
+                    get_answer_cache().add(q_vec, {
+                        "question": question.strip(),
+                        "final_response": final_response,
+                        "sources": [
+                            asdict(r) for r in result_state["queries_results"]
+                        ],
+                    })
                     
             except Exception as e:
                 status.update(label="Erro na execução", state="error")
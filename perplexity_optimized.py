@@ -2,6 +2,7 @@
 perplexity_markdown_clean.py - Formatação Markdown limpa + UI melhorado
 """
 
+import html
 import streamlit as st
 from typing import List, Dict, Any
 from pydantic import BaseModel
@@ -12,7 +13,8 @@ from langgraph.graph import START, END, StateGraph
 from langchain_ollama import ChatOllama
 
 from schemas import ReportState, QueryResult
-from utils import tavily_search
+from utils import clean_and_truncate, dedupe_results, tavily_search
+from llm_cache import cached_invoke, cached_stream
 
 load_dotenv()
 
@@ -78,9 +80,9 @@ def generate_queries(state: ReportState) -> Dict[str, Any]:
         llm = get_llm()
         prompt = QUERY_PROMPT.format(user_input=state.user_input)
         
-        response = llm.invoke(prompt)
+        content = cached_invoke(llm, prompt)
         
-        lines = response.content.strip().split('\n')
+        lines = content.strip().split('\n')
         queries = []
         
         for line in lines:
@@ -110,25 +112,28 @@ def execute_search(state: ReportState) -> Dict[str, Any]:
     collected = []
     
     try:
+        top_results = []
         for i, query in enumerate(state.queries):
             print(f"🔍 Buscando: {query}")
             
             tavily_resp = tavily_search(query, max_results=1, include_raw_content=True)
             
             if tavily_resp.get("results"):
-                r = tavily_resp["results"][0]
-                
-                content = r.get("raw_content") or r.get("content", "")
-                content = content[:1000] if content else ""
-                
-                result = QueryResult(
-                    title=r.get("title", "Sem título"),
-                    url=r.get("url", ""),
-                    resume=content
-                )
-                
-                collected.append(result)
-                print(f"✅ Processado: {result.title}")
+                top_results.append(tavily_resp["results"][0])
+        
+        # Mesma página vinda de queries diferentes entra só uma vez no prompt
+        for r in dedupe_results(top_results):
+            content = r.get("raw_content") or r.get("content", "")
+            content = clean_and_truncate(content, max_tokens=250) if content else ""
+            
+            result = QueryResult(
+                title=r.get("title", "Sem título"),
+                url=r.get("url", ""),
+                resume=content
+            )
+            
+            collected.append(result)
+            print(f"✅ Processado: {result.title}")
                 
     except Exception as e:
         print(f"❌ Erro na busca: {e}")
@@ -137,30 +142,22 @@ def execute_search(state: ReportState) -> Dict[str, Any]:
     return {"queries_results": collected}
 
 def write_response(state: ReportState) -> Dict[str, Any]:
-    """Gera resposta em Markdown limpo"""
+    """Monta o prompt da resposta (gerada em streaming pela UI)"""
     if not state.queries_results:
         return {"final_response": "Não foi possível encontrar informações relevantes."}
     
-    try:
-        search_context = []
-        for i, res in enumerate(state.queries_results, 1):
-            search_context.append(f"[{i}] {res.title}: {res.resume}")
-        
-        context = "\n\n".join(search_context)
-        prompt = FINAL_PROMPT.format(
-            user_input=state.user_input,
-            search_results=context
-        )
-        
-        llm = get_llm()
-        response = llm.invoke(prompt)
-        
-        print("✅ Resposta final gerada")
-        return {"final_response": response.content.strip()}
-        
-    except Exception as e:
-        print(f"❌ Erro na resposta final: {e}")
-        return {"final_response": f"Erro ao gerar resposta: {str(e)}"}
+    search_context = []
+    for i, res in enumerate(state.queries_results, 1):
+        search_context.append(f"[{i}] {res.title}: {res.resume}")
+    
+    context = "\n\n".join(search_context)
+    prompt = FINAL_PROMPT.format(
+        user_input=state.user_input,
+        search_results=context
+    )
+    
+    print("✅ Prompt final montado")
+    return {"final_prompt": prompt}
 
 # --------------------------------------------------------------------------- #
 # Grafo                                                                      #
@@ -185,46 +182,34 @@ def create_graph():
 # Interface melhorada                                                        #
 # --------------------------------------------------------------------------- #
 
+SOURCE_CARD_STYLE = (
+    "background: #1a1a1a; border: 1px solid #333; border-radius: 8px; "
+    "padding: 1rem; margin: 0.5rem 0; border-left: 3px solid #3b82f6;"
+)
+SOURCE_TITLE_STYLE = "color: #3b82f6; font-weight: 600; margin-bottom: 0.5rem;"
+SOURCE_URL_STYLE = "color: #9ca3af; font-size: 0.9rem; margin-bottom: 0.5rem;"
+SOURCE_LINK_STYLE = "color: #60a5fa; text-decoration: none;"
+
 def display_sources_clean(sources: List[QueryResult]):
-    """Exibe fontes em estilo limpo"""
+    """Exibe fontes em estilo limpo (um único st.markdown para todos os cards)"""
     if not sources:
         return
     
-    st.markdown("## 📚 Sources")
-    
-    for i, source in enumerate(sources, 1):
-        with st.container():
-            # Card de fonte mais limpo
-            st.markdown(f"""
-            <div style="
-                background: #1a1a1a;
-                border: 1px solid #333;
-                border-radius: 8px;
-                padding: 1rem;
-                margin: 0.5rem 0;
-                border-left: 3px solid #3b82f6;
-            ">
-                <div style="color: #3b82f6; font-weight: 600; margin-bottom: 0.5rem;">
-                    [{i}] {source.title}
-                </div>
-                <div style="color: #9ca3af; font-size: 0.9rem; margin-bottom: 0.5rem;">
-                    <a href="{source.url}" target="_blank" style="color: #60a5fa; text-decoration: none;">
-                        {source.url[:60]}{'...' if len(source.url) > 60 else ''}
-                    </a>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-
-def main():
-    st.set_page_config(
-        page_title="Local Perplexity",
-        page_icon="🔍",
-        layout="centered",  # Mudado para centered
-        initial_sidebar_state="collapsed"
+    cards = "\n".join(
+        f'<div style="{SOURCE_CARD_STYLE}">'
+        f'<div style="{SOURCE_TITLE_STYLE}">[{i}] {html.escape(source.title)}</div>'
+        f'<div style="{SOURCE_URL_STYLE}">'
+        f'<a href="{html.escape(source.url)}" target="_blank" style="{SOURCE_LINK_STYLE}">'
+        f'{html.escape(source.url[:60])}{"..." if len(source.url) > 60 else ""}'
+        f'</a></div></div>'
+        for i, source in enumerate(sources, 1)
     )
-    
-    # CSS melhorado para UI mais limpa
-    st.markdown("""
+    st.markdown(f"## 📚 Sources\n\n{cards}", unsafe_allow_html=True)
+
+@st.cache_resource
+def load_css() -> str:
+    """CSS do tema escuro, montado uma vez por processo"""
+    return """
     <style>
     /* Fundo escuro */
     .stApp {
@@ -384,7 +369,18 @@ def main():
         font-size: 0.9rem !important;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def main():
+    st.set_page_config(
+        page_title="Local Perplexity",
+        page_icon="🔍",
+        layout="centered",  # Mudado para centered
+        initial_sidebar_state="collapsed"
+    )
+    
+    # CSS melhorado para UI mais limpa
+    st.markdown(load_css(), unsafe_allow_html=True)
     
     # Header mais compacto
     st.markdown("""
@@ -418,61 +414,54 @@ def main():
                 graph = create_graph()
                 initial_state = ReportState(user_input=question.strip())
                 
-                final_step = None
-                all_data = {}
-                
-                for step in graph.stream(initial_state.model_dump()):
-                    for key, value in step.items():
-                        if isinstance(value, dict):
-                            all_data.update(value)
-                    final_step = step
-                
-                execution_time = time.time() - start_time
-                status.update(label=f"✅ Completed in {execution_time:.1f}s", state="complete")
+                # stream_mode="values" emite o estado completo após cada nó;
+                # basta guardar a referência do último
+                final_state: Dict[str, Any] = {}
+                for final_state in graph.stream(
+                    initial_state.model_dump(), stream_mode="values"
+                ):
+                    pass
                 
                 # Extrai dados
-                final_response = None
-                sources = []
-                queries = []
-                
-                if final_step:
-                    for node_name, node_data in final_step.items():
-                        if isinstance(node_data, dict):
-                            if "final_response" in node_data:
-                                final_response = node_data["final_response"]
-                            if "queries_results" in node_data:
-                                sources = node_data["queries_results"]
-                            if "queries" in node_data:
-                                queries = node_data["queries"]
-                
-                if not final_response:
-                    final_response = all_data.get("final_response")
-                if not sources:
-                    sources = all_data.get("queries_results", [])
-                if not queries:
-                    queries = all_data.get("queries", [])
+                final_response = final_state.get("final_response")
+                final_prompt = final_state.get("final_prompt")
+                sources = final_state.get("queries_results", [])
+                queries = final_state.get("queries", [])
                 
                 # Display
-                if final_response:
-                    # Métricas compactas
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.metric("⏱️ Time", f"{execution_time:.1f}s")
-                    with col2:
-                        st.metric("📚 Sources", len(sources))
-                    with col3:
-                        st.metric("🔍 Queries", len(queries))
+                if final_response or final_prompt:
+                    # Métricas compactas (preenchidas ao fim do streaming)
+                    metrics = st.empty()
                     
-                    # Resposta em Markdown LIMPO
+                    # Resposta em Markdown LIMPO, em streaming
                     st.markdown('<div class="answer-container">', unsafe_allow_html=True)
-                    st.markdown(final_response)
+                    if final_prompt:
+                        final_response = st.write_stream(
+                            cached_stream(get_llm(), final_prompt)
+                        )
+                    else:
+                        st.markdown(final_response)
                     st.markdown('</div>', unsafe_allow_html=True)
                     
+                    execution_time = time.time() - start_time
+                    status.update(label=f"✅ Completed in {execution_time:.1f}s", state="complete")
+                    
+                    with metrics.container():
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("⏱️ Time", f"{execution_time:.1f}s")
+                        with col2:
+                            st.metric("📚 Sources", len(sources))
+                        with col3:
+                            st.metric("🔍 Queries", len(queries))
+                    
                     # Fontes
                     if sources:
                         display_sources_clean(sources)
                     
                 else:
+                    execution_time = time.time() - start_time
+                    status.update(label=f"✅ Completed in {execution_time:.1f}s", state="complete")
                     st.error("❌ No answer generated")
                     
             except Exception as e:
@@ -7,7 +7,11 @@ using sources found online.
 
 Your answer MUST be technical, using up-to-date information.
 Cite facts, data and specific information.
+"""
 
+# A pergunta vai no fim de cada prompt: o prefixo acima fica byte-idêntico
+# entre as chamadas e o Ollama reaproveita o KV-cache dele (sem novo prefill)
+user_input_block = """
 Here is the user input
 <USER_INPUT>
 {user_input}
@@ -19,20 +23,24 @@ Your first objective is to build a list of queries
 that will be used to find answers to the user's question.
 
 Return 3-5 queries.
-"""
+""" + user_input_block
 
-resume_search = agent_prompt + """
-Your objective here is to analyze the web search results and make a synthesis,
-emphasising only what is relevant to the user's question.
+resume_search_batch = agent_prompt + """
+Your objective here is to analyze several web search results and make a
+synthesis of EACH one, emphasising only what is relevant to the user's question.
 
-After your work, another agent will use the synthesis to build the final response,
+After your work, another agent will use the syntheses to build the final response,
 so keep only useful information. Be concise and clear.
 
+Each result is tagged with a numbered index, e.g. [1].
+Return exactly one summary per result, using the same index.
+Keep each summary under 100 words.
+
 Here are the web search results:
 <SEARCH_RESULTS>
 {search_results}
 </SEARCH_RESULTS>
-"""
+""" + user_input_block
 
 build_final_response = agent_prompt + """
 Your objective is to develop a final response to the user using
@@ -46,4 +54,4 @@ Here are the search results:
 </SEARCH_RESULTS>
 
 Cite your references with numbered tags, e.g. [1], inside each paragraph.
-"""
+""" + user_input_block
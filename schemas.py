@@ -1,13 +1,38 @@
-from typing import List
-from pydantic import BaseModel
+from dataclasses import dataclass
+from typing import Any, List
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
-class QueryResult(BaseModel):
+# Dataclass com slots (não BaseModel): criada uma vez por resultado e lida
+# várias vezes; sem pipeline de validação e com metade da memória
+@dataclass(slots=True, frozen=True)
+class QueryResult:
     title: str
     url: str
     resume: str
 
+class SourceSummary(BaseModel):
+    idx: int
+    summary: str
+
+class BatchSummaries(BaseModel):
+    summaries: List[SourceSummary]
+
 class ReportState(BaseModel):
+    # estado é reconstruído a cada nó: sem revalidar atribuições nem
+    # rejeitar chaves extras vindas do grafo
+    model_config = ConfigDict(validate_assignment=False, extra="ignore")
+
     user_input: str = ""
     queries: List[str] = []
-    queries_results: List[QueryResult] = []
-    final_response: str = ""
\ No newline at end of file
+    queries_results: List[QueryResult] = Field(default_factory=list)
+    final_prompt: str = ""
+    references: str = ""
+    final_response: str = ""
+
+    @field_validator("queries_results", mode="before")
+    @classmethod
+    def _coerce_results(cls, value: Any) -> Any:
+        # dicts (ex.: estado serializado via model_dump) → QueryResult
+        if isinstance(value, list):
+            return [QueryResult(**r) if isinstance(r, dict) else r for r in value]
+        return value
\ No newline at end of file
@@ -0,0 +1,288 @@
+# search_cache.py
+"""
+Cache das respostas dos provedores de busca (Tavily, Perplexity, OpenPerplex).
+
+Dentro de uma janela razoável, a resposta de um provedor é função de
+(consulta, parâmetros); repetir a mesma busca devolve o JSON salvo em
+menos de 1 ms em vez de pagar 1–3 s de rede e a cota da API.
+
+• QueryCache           — LRU em memória + SQLite (WAL) com TTL por entrada
+• SemanticSearchCache  — buscas parafraseadas, por similaridade de embedding
+• cached_call          — decorator para funções de busca síncronas ou assíncronas
+
+Usa o mesmo diretório e o mesmo interruptor do cache de LLM
+(`LLM_CACHE_DIR`, `LLM_CACHE=0`); a validade padrão é de 1 dia
+(`SEARCH_CACHE_TTL`, em segundos). A camada semântica é opcional
+(`SEMANTIC_SEARCH_CACHE=1`) e depende do modelo de embedding do Ollama.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from llm_cache import CACHE_DIR, CACHE_ENABLED, SemanticCache, open_sqlite
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "86400"))
+SEMANTIC_SEARCH_CACHE = os.getenv("SEMANTIC_SEARCH_CACHE", "0") == "1"
+SEMANTIC_SEARCH_THRESHOLD = float(os.getenv("SEMANTIC_SEARCH_THRESHOLD", "0.9"))
+
+log = logging.getLogger("perplexity.search_cache")
+
+_WS_RE = re.compile(r"\s+")
+
+
+# --------------------------------------------------------------------------- #
+# Armazenamento                                                               #
+# --------------------------------------------------------------------------- #
+
+class QueryCache:
+    """
+    Mapa chave → valor JSON com expiração, seguro entre threads.
+
+    As entradas quentes ficam num `OrderedDict` (LRU, limitado a
+    `max_entries`); o SQLite guarda tudo para reaproveitar entre
+    reinícios do Streamlit. A memória guarda o JSON serializado e cada
+    leitura devolve uma cópia nova: mutar o resultado não altera o cache.
+    """
+
+    def __init__(self, path: str, default_ttl: float = 3600, max_entries: int = 512):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._mem: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # locks separados: `peek` no event loop nunca espera por I/O do SQLite
+        self._mem_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        """Abre o SQLite no primeiro uso e apaga o que já expirou (chamar com `_db_lock`)."""
+        if self._conn is None:
+            conn = open_sqlite(self.path)
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+                )
+                conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: str, expires_at: float, text: str) -> None:
+        with self._mem_lock:
+            self._mem[key] = (expires_at, text)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Só a camada em memória: sem I/O, seguro de chamar no event loop."""
+        with self._mem_lock:
+            if (entry := self._mem.get(key)) is None:
+                return None
+            expires_at, text = entry
+            if expires_at <= time.time():
+                del self._mem[key]
+                return None
+            self._mem.move_to_end(key)
+        return json.loads(text)
+
+    def get(self, key: str) -> Optional[Any]:
+        if (value := self.peek(key)) is not None:
+            return value
+
+        with self._db_lock:
+            row = self._db().execute(
+                "SELECT expires_at, value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if not row or row[0] <= time.time():
+            return None
+        self._remember(key, row[0], row[1])
+        return json.loads(row[1])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        text = json.dumps(value, ensure_ascii=False)
+        with self._db_lock, self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, expires_at, text),
+            )
+        self._remember(key, expires_at, text)
+
+
+class SemanticSearchCache:
+    """
+    Respostas de busca indexadas pelo embedding da consulta.
+
+    Cada combinação provedor + parâmetros + modelo de embedding tem seu
+    próprio `SemanticCache` (um arquivo por "balde"), para que uma busca
+    parecida nunca devolva o resultado de outro provedor ou de outro
+    `max_results`. As entradas expiram com o mesmo TTL do cache exato.
+    """
+
+    def __init__(self, directory: str, threshold: float = 0.9):
+        self.directory = directory
+        self.threshold = threshold
+        self._buckets: Dict[str, SemanticCache] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, bucket: str) -> SemanticCache:
+        with self._lock:
+            if bucket not in self._buckets:
+                self._buckets[bucket] = SemanticCache(
+                    os.path.join(self.directory, f"{bucket}.sqlite"),
+                    threshold=self.threshold,
+                )
+            return self._buckets[bucket]
+
+    def get(self, bucket: str, vec: np.ndarray) -> Optional[Any]:
+        return self._bucket(bucket).get(vec)
+
+    def add(self, bucket: str, vec: np.ndarray, value: Any, ttl: float) -> None:
+        self._bucket(bucket).add(vec, value, ttl=ttl)
+
+
+search_cache = QueryCache(os.path.join(CACHE_DIR, "search.sqlite"))
+semantic_search_cache = SemanticSearchCache(
+    os.path.join(CACHE_DIR, "semantic_search"),
+    threshold=SEMANTIC_SEARCH_THRESHOLD,
+)
+
+
+def normalize_query(query: str) -> str:
+    """Minúsculas, espaços colapsados e pontuação das pontas removida."""
+    return _WS_RE.sub(" ", query.lower()).strip(" .,;:!?¿¡\"'")
+
+
+def _make_key(
+    provider: str, query: str, params: Dict[str, Any], normalize: bool = True
+) -> str:
+    """SHA-256 de tudo que influencia a resposta do provedor."""
+    if normalize:
+        query = normalize_query(query)
+    raw = f"{provider}:{query}:{json.dumps(params, sort_keys=True)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _semantic_lookup(
+    provider: str, query: str, params: Dict[str, Any]
+) -> tuple[Optional[Any], Optional[str], Optional[np.ndarray]]:
+    """
+    (valor em cache, balde, embedding da consulta).
+
+    Falhas do Ollama só desligam a camada semântica nesta chamada;
+    a busca segue normalmente.
+    """
+    # import tardio: utils importa este módulo para decorar os provedores
+    from utils import EMBED_MODEL, embed_batch
+
+    ns = hashlib.sha256(f"{EMBED_MODEL}:{json.dumps(params, sort_keys=True)}".encode())
+    bucket = f"{provider}-{ns.hexdigest()[:16]}"
+    try:
+        vec = embed_batch([normalize_query(query)])[0]
+    except Exception as e:
+        log.warning("Cache semântico de busca indisponível: %s", e)
+        return None, None, None
+    return semantic_search_cache.get(bucket, vec), bucket, vec
+
+
+# --------------------------------------------------------------------------- #
+# Decorator                                                                   #
+# --------------------------------------------------------------------------- #
+
+def cached_call(
+    provider: str, ttl: float = SEARCH_CACHE_TTL, exact: bool = False
+) -> Callable:
+    """
+    Cacheia `fn(query, **params)` por `ttl` segundos.
+
+    Funciona com funções síncronas e `async def`; as duas variantes de
+    um mesmo provedor (ex.: `tavily_search` e `tavily_search_async`)
+    compartilham as entradas por usarem o mesmo `provider`.
+
+    Ordem de consulta: cache exato (sem custo) → cache semântico, se
+    ligado (um embedding, ~10 ms) → chamada real ao provedor.
+    `exact=True` é para chaves que não são texto livre (ex.: URLs): a
+    consulta entra na chave sem normalização e sem camada semântica.
+    """
+    def decorator(fn: Callable) -> Callable:
+        sig = inspect.signature(fn)
+
+        def bound_params(query: str, params: Dict[str, Any]) -> Dict[str, Any]:
+            # Parâmetros omitidos entram com o default, para que
+            # `fn(q)` e `fn(q, max_results=3)` caiam na mesma entrada.
+            bound = sig.bind(query, **params)
+            bound.apply_defaults()
+            args = dict(bound.arguments)
+            args.pop(next(iter(sig.parameters)))
+            return args
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(query: str, **params: Any) -> Any:
+                if not CACHE_ENABLED:
+                    return await fn(query, **params)
+                args = bound_params(query, params)
+                key = _make_key(provider, query, args, normalize=not exact)
+                # memória no loop; SQLite numa thread para não travar o gather
+                hit = search_cache.peek(key)
+                if hit is None:
+                    hit = await asyncio.to_thread(search_cache.get, key)
+                if hit is not None:
+                    return hit
+                bucket = vec = None
+                if not exact and SEMANTIC_SEARCH_CACHE:
+                    hit, bucket, vec = await asyncio.to_thread(
+                        _semantic_lookup, provider, query, args
+                    )
+                    if hit is not None:
+                        return hit
+                out = await fn(query, **params)
+                if out is None:  # falha do provedor: tenta de novo na próxima
+                    return out
+                await asyncio.to_thread(search_cache.set, key, out, ttl)
+                if vec is not None:
+                    await asyncio.to_thread(semantic_search_cache.add, bucket, vec, out, ttl)
+                return out
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(query: str, **params: Any) -> Any:
+            if not CACHE_ENABLED:
+                return fn(query, **params)
+            args = bound_params(query, params)
+            key = _make_key(provider, query, args, normalize=not exact)
+            if (hit := search_cache.get(key)) is not None:
+                return hit
+            bucket = vec = None
+            if not exact and SEMANTIC_SEARCH_CACHE:
+                hit, bucket, vec = _semantic_lookup(provider, query, args)
+                if hit is not None:
+                    return hit
+            out = fn(query, **params)
+            if out is None:
+                return out
+            search_cache.set(key, out, ttl)
+            if vec is not None:
+                semantic_search_cache.add(bucket, vec, out, ttl)
+            return out
+
+        return wrapper
+
+    return decorator
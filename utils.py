@@ -3,87 +3,322 @@
 Utilidades de busca e formatação de fontes.
 
 • Tavily  — busca web estruturada
-• Perplexity API  — busca LLM-first (opcional)
+• Páginas  — download direto da origem + extração de texto
+• Perplexity API  — busca LLM-first, com ou sem streaming (opcional)
 • OpenPerplex  — busca web + IA (opcional)
+• Ollama  — pré-carregamento de modelos (keep-alive) e embeddings em lote
 
 Todas as funções retornam dicionários padronizados para que os nós do
 LangGraph montem o objeto `QueryResult` sem precisar conhecer detalhes
-de cada provedor.
+de cada provedor. As respostas dos provedores de busca passam pelo cache
+com TTL de `search_cache.py`.
 """
 
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
+import io
+import logging
+import operator
 import os
-import requests
-from typing import Dict, Any, List
+import re
+import threading
+import time
+from html.parser import HTMLParser
+from itertools import chain
+from types import MappingProxyType
+import httpx
+import numpy as np
+import orjson
+from typing import AsyncIterator, Awaitable, Dict, Any, Iterable, Iterator, List, Mapping
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_exponential_jitter,
+)
 
-from tavily import TavilyClient
-from openperplex import OpenperplexSync
-from langsmith import traceable
 from dotenv import load_dotenv
 
 load_dotenv()  # lê as variáveis de ambiente do .env local
 
+from search_cache import cached_call  # noqa: E402  (lê LLM_CACHE_* do .env)
+
+# LangSmith só é importado com tracing ligado; sem ele `traceable` é no-op
+if os.getenv("LANGSMITH_TRACING", os.getenv("LANGCHAIN_TRACING_V2", "")).lower() == "true":
+    from langsmith import traceable
+else:
+    def traceable(fn):
+        return fn
+
+log = logging.getLogger("perplexity.utils")
+
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
+_ollama_host = os.getenv("OLLAMA_HOST", "127.0.0.1:11434")
+OLLAMA_URL = _ollama_host if "://" in _ollama_host else f"http://{_ollama_host}"
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+
+
+# --------------------------------------------------------------------------- #
+# Clientes HTTP compartilhados                                                #
+# --------------------------------------------------------------------------- #
+
+_HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+_HTTP_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+# Pool com keep-alive: o handshake TCP+TLS com cada host acontece uma vez e é
+# reaproveitado pelas buscas seguintes (HTTP/2 multiplexa as concorrentes).
+_HTTP = httpx.Client(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT, http2=True)
+
+# Conexões de um AsyncClient ficam presas ao event loop que as abriu; como o
+# Streamlit roda cada pesquisa num `asyncio.run` novo, há um cliente por loop.
+# O transporte referencia o loop, então a entrada nunca sai sozinha: quem abre
+# o loop fecha o cliente ao final (`run_async` ou `aclose_async_http`).
+_AHTTP: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+
+def _async_http() -> httpx.AsyncClient:
+    """AsyncClient com pool do event loop corrente (criado sob demanda)."""
+    loop = asyncio.get_running_loop()
+    client = _AHTTP.get(loop)
+    if client is None:
+        client = _AHTTP[loop] = httpx.AsyncClient(
+            limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT, http2=True
+        )
+    return client
+
+
+async def aclose_async_http() -> None:
+    """Fecha o AsyncClient do loop corrente, se houver (sockets inclusos)."""
+    client = _AHTTP.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_async(coro: Awaitable[Any]) -> Any:
+    """`asyncio.run` que fecha o AsyncClient do loop antes de encerrá-lo."""
+    async def runner() -> Any:
+        try:
+            return await coro
+        finally:
+            await aclose_async_http()
+
+    return asyncio.run(runner())
+
 
 # --------------------------------------------------------------------------- #
 # Helpers de formatação                                                      #
 # --------------------------------------------------------------------------- #
 
-def deduplicate_and_format_sources(
+_SOURCES_HEADER = "Sources:\n\n"
+_HOST_END_RE = re.compile(r"[/?]")
+_TRUNCATED = "... [truncated]"
+
+
+def canonical_url(url: str) -> str:
+    """
+    Chave de deduplicação de uma URL (a URL exibida continua a original).
+
+    Remove o fragmento (`#...`) e a barra final, põe esquema e host em
+    minúsculas e trata `http` como `https`; o caminho mantém a caixa,
+    pois em muitos servidores ele diferencia páginas (a query string também).
+    """
+    base = url.partition("#")[0].rstrip("/")
+    scheme, sep, rest = base.partition("://")
+    if not sep:
+        return base
+    # o host termina no primeiro `/` ou `?` (`https://ex.com?q=A` não tem caminho)
+    end = _HOST_END_RE.search(rest)
+    cut = end.start() if end else len(rest)
+    scheme = scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+    return f"{scheme}://{rest[:cut].lower()}{rest[cut:]}"
+
+
+def _to_soa(results: Iterable[dict]) -> Dict[str, List[Any]]:
+    """
+    Converte resultados estilo Tavily (lista de dicts) em listas paralelas
+    por campo: {'titles', 'urls', 'contents', 'raws'}.
+
+    Cada campo é lido uma única vez por resultado; o laço de formatação
+    percorre as listas com `zip`, sem consultas a dicionário.
+    """
+    titles: List[str] = []
+    urls: List[str] = []
+    contents: List[str] = []
+    raws: List[str | None] = []
+    for src in results:
+        titles.append(src["title"])
+        urls.append(src["url"])
+        contents.append(src["content"])
+        raws.append(src.get("raw_content"))
+    return {"titles": titles, "urls": urls, "contents": contents, "raws": raws}
+
+
+def iter_formatted_sources(
     search_response: dict | list,
     max_tokens_per_source: int = 2_048,
     include_raw_content: bool = False,
-) -> str:
+) -> Iterator[str]:
     """
-    Recebe um único dicionário ou lista de dicionários de resposta de busca
-    (estilo Tavily) e devolve uma string formatada com fontes únicas.
+    Versão em streaming de `deduplicate_and_format_sources`: gera o texto
+    em pedaços (cabeçalho, depois cada fonte), na ordem.
 
-    • Deduplica por URL
-    • Trunca raw_content (≈4 chars ≅ 1 token) se solicitado
+    Quem escreve em arquivo/socket pode consumir fonte a fonte sem
+    manter a string inteira em memória.
     """
-    # Normaliza para lista
+    # Normaliza para um iterável de resultados (listas são encadeadas sem cópia)
     if isinstance(search_response, dict):
-        sources_list: List[dict] = search_response.get("results", [])
+        sources: Iterable[dict] = search_response.get("results", [])
     elif isinstance(search_response, list):
-        sources_list = []
-        for resp in search_response:
-            sources_list.extend(resp.get("results", []))
+        sources = chain.from_iterable(resp.get("results", []) for resp in search_response)
     else:
         raise ValueError(
             "search_response precisa ser dict{'results':…} ou list de resultados."
         )
 
-    # Deduplicação
-    unique: dict[str, dict] = {src["url"]: src for src in sources_list}
-
-    lines: List[str] = ["Sources:\n"]
-    for src in unique.values():
-        lines.append(f"Source {src['title']}:\n===")
-        lines.append(f"URL: {src['url']}\n===")
-        lines.append(f"Most relevant content: {src['content']}\n===")
-        if include_raw_content and (raw := src.get("raw_content")):
-            limit = max_tokens_per_source * 4
-            snippet = (raw[:limit] + "... [truncated]") if len(raw) > limit else raw
-            lines.append(
-                f"Full source content "
-                f"(≤{max_tokens_per_source} tokens≈{limit} chars): {snippet}\n"
-            )
-        lines.append("")  # linha em branco
-    return "\n".join(lines).strip()
+    soa = _to_soa(sources)
+
+    # Invariantes do laço calculadas uma única vez
+    limit = max_tokens_per_source * 4
+    raw_prefix = f"Full source content (≤{max_tokens_per_source} tokens≈{limit} chars): "
+
+    yield _SOURCES_HEADER
+    # Deduplicação no mesmo passo: fica a primeira ocorrência (melhor ranqueada)
+    seen: set[str] = set()
+    for title, url, content, raw in zip(
+        soa["titles"], soa["urls"], soa["contents"], soa["raws"]
+    ):
+        key = canonical_url(url)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield (
+            f"Source {title}:\n===\n"
+            f"URL: {url}\n===\n"
+            f"Most relevant content: {content}\n===\n"
+        )
+        if include_raw_content and raw:
+            # a fatia sai direto, sem montar `snippet + sufixo`
+            yield raw_prefix
+            if len(raw) > limit:
+                yield raw[:limit]
+                yield _TRUNCATED
+            else:
+                yield raw
+            yield "\n\n"
+        yield "\n"  # linha em branco entre fontes
+
+
+def deduplicate_and_format_sources(
+    search_response: dict | list,
+    max_tokens_per_source: int = 2_048,
+    include_raw_content: bool = False,
+) -> str:
+    """
+    Recebe um único dicionário ou lista de dicionários de resposta de busca
+    (estilo Tavily) e devolve uma string formatada com fontes únicas.
+
+    • Deduplica por URL canônica, mantendo a primeira ocorrência (e a URL original)
+    • Trunca raw_content (≈4 chars ≅ 1 token) se solicitado
+    """
+    return "".join(
+        iter_formatted_sources(search_response, max_tokens_per_source, include_raw_content)
+    ).strip()
+
+
+_WS_RE = re.compile(r"[ \t\f\v\u00a0]+")
+# linhas que são só link/imagem markdown (menus, banners, rodapés)
+_LINK_ONLY_RE = re.compile(r"^(?:!?\[[^\]]*\]\([^)]*\)\s*[|·•-]?\s*)+$")
+
+
+def clean_and_truncate(text: str, max_tokens: int = 1_500) -> str:
+    """
+    Limpa conteúdo bruto de página e corta em ~`max_tokens` tokens.
+
+    • Colapsa espaços e remove linhas vazias
+    • Descarta linhas repetidas e linhas só de links/imagens (boilerplate)
+    • Trunca (≈4 chars ≅ 1 token) no último espaço antes do limite
+
+    Mantém o prefill do LLM limitado independentemente do tamanho da página.
+    """
+    seen: set[str] = set()
+    lines: List[str] = []
+    for line in text.splitlines():
+        line = _WS_RE.sub(" ", line).strip()
+        if not line or line in seen or _LINK_ONLY_RE.match(line):
+            continue
+        seen.add(line)
+        lines.append(line)
+    cleaned = "\n".join(lines)
+
+    limit = max_tokens * 4
+    if len(cleaned) <= limit:
+        return cleaned
+    cut = cleaned.rfind(" ", 0, limit)
+    return cleaned[: cut if cut > 0 else limit] + _TRUNCATED
+
+
+def dedupe_results(results: List[dict]) -> List[dict]:
+    """
+    Remove resultados repetidos entre queries diferentes, mantendo o primeiro.
+
+    Repetido = mesma URL (ver `canonical_url`) ou mesmo conteúdo (hash dos
+    primeiros 2 KB), o que pega espelhos e URLs com parâmetros de rastreio.
+    """
+    seen_urls: set[str] = set()
+    seen_hashes: set[bytes] = set()
+    unique: List[dict] = []
+    for r in results:
+        content = r.get("raw_content") or r.get("content") or ""
+        digest = hashlib.blake2b(content[:2048].encode(), digest_size=8).digest()
+        url = canonical_url(r["url"])
+        if url in seen_urls or (content and digest in seen_hashes):
+            continue
+        seen_urls.add(url)
+        if content:
+            seen_hashes.add(digest)
+        unique.append(r)
+    return unique
+
+
+_TITLE_URL = operator.itemgetter("title", "url")
 
 
 def format_sources(search_results: dict) -> str:
     """Converte resposta Tavily em lista-bullet de fontes."""
-    return "\n".join(
-        f"* {src['title']} : {src['url']}" for src in search_results["results"]
-    )
+    return "\n".join("* %s : %s" % _TITLE_URL(src) for src in search_results["results"])
 
 
 # --------------------------------------------------------------------------- #
 # Provedores de busca                                                         #
 # --------------------------------------------------------------------------- #
 
+# Chaves lidas uma vez no import (após o .env); a ausência só gera erro
+# quando o provedor correspondente é de fato chamado.
+_TAVILY_KEY = os.getenv("TAVILY_API_KEY")
+_PPLX_KEY = os.getenv("PERPLEXITY_API_KEY")
+_OP_KEY = os.getenv("OPENPERPLEX_API_KEY")
+
+# Só existem com a chave presente: nunca há um "Bearer None" para vazar
+# numa requisição
+_TAVILY_AUTH = {"Authorization": f"Bearer {_TAVILY_KEY}"} if _TAVILY_KEY else None
+_PPLX_AUTH = f"Bearer {_PPLX_KEY}" if _PPLX_KEY else None
+
+
+def _tavily_headers() -> Dict[str, str]:
+    if _TAVILY_AUTH is None:
+        raise RuntimeError("TAVILY_API_KEY não definida no ambiente.")
+    return _TAVILY_AUTH
+
+
 @traceable
+@cached_call(provider="tavily")
 def tavily_search(
     query: str,
     *,
@@ -91,7 +326,9 @@ def tavily_search(
     max_results: int = 3,
 ) -> dict:
     """
-    Busca Tavily e retorna dicionário no formato original.
+    Busca Tavily (API REST via pool HTTP) e retorna dicionário no formato original.
+
+    Necessita `TAVILY_API_KEY` no ambiente.
 
     Args:
         query: texto da busca
@@ -100,54 +337,203 @@ def tavily_search(
 
     Returns: dict  →  {'results': [ {...}, ... ]}
     """
-    client = TavilyClient()
-    return client.search(
-        query=query,
-        max_results=max_results,
-        include_raw_content=include_raw_content,
+    resp = _HTTP.post(
+        TAVILY_SEARCH_URL,
+        headers=_tavily_headers(),
+        json={
+            "query": query,
+            "max_results": max_results,
+            "include_raw_content": include_raw_content,
+        },
     )
+    resp.raise_for_status()
+    return resp.json()
 
 
 @traceable
-def perplexity_search(
+@cached_call(provider="tavily")
+async def tavily_search_async(
     query: str,
     *,
-    model: str = "sonar",
-    perplexity_search_loop_count: int = 0,
-) -> Dict[str, Any]:
+    include_raw_content: bool = True,
+    max_results: int = 3,
+) -> dict:
     """
-    Busca usando a Perplexity API.
+    Versão assíncrona de `tavily_search` (mesmo formato de retorno).
 
-    Necessita `PERPLEXITY_API_KEY` no ambiente.
+    Permite que o nó de busca dispare todas as queries concorrentemente.
+    """
+    resp = await _async_http().post(
+        TAVILY_SEARCH_URL,
+        headers=_tavily_headers(),
+        json={
+            "query": query,
+            "max_results": max_results,
+            "include_raw_content": include_raw_content,
+        },
+    )
+    resp.raise_for_status()
+    return resp.json()
 
-    Retorna estrutura de resultados similar à Tavily:
-        {'results': [ {'title', 'url', 'content', 'raw_content'}, ... ] }
+
+PERPLEXITY_CHAT_URL = "https://api.perplexity.ai/chat/completions"
+# conexão falha rápido; a geração da resposta pode levar quase um minuto
+_PPLX_TIMEOUT = httpx.Timeout(55.0, connect=5.0)
+
+
+class CircuitOpenError(RuntimeError):
+    """O provedor falhou demais em sequência; a chamada nem foi feita."""
+
+
+class CircuitBreaker:
+    """
+    Disjuntor simples para um provedor HTTP.
+
+    Após `fail_max` falhas transitórias seguidas (rede, 429, 5xx) fica
+    aberto por `reset_timeout` segundos, recusando chamadas na hora
+    (`CircuitOpenError`) em vez de empilhar timeouts. Passado esse tempo
+    deixa uma única chamada de teste passar (as concorrentes continuam
+    recusadas): sucesso fecha o disjuntor, nova falha reabre. Erros do
+    cliente, como 401, não contam.
+
+    Uso: `with breaker: resp = ...` (também em código assíncrono).
     """
-    api_key = os.getenv("PERPLEXITY_API_KEY")
-    if not api_key:
+
+    def __init__(self, name: str, fail_max: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "CircuitBreaker":
+        with self._lock:
+            if self._opened_at is not None:
+                waiting = time.monotonic() - self._opened_at < self.reset_timeout
+                if waiting or self._trial:
+                    raise CircuitOpenError(f"{self.name} indisponível (circuito aberto).")
+                self._trial = True  # meio-aberto: só esta chamada passa
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        with self._lock:
+            self._trial = False
+            if exc_type is None:
+                self._failures = 0
+                self._opened_at = None
+            elif _is_transient(exc):
+                self._failures += 1
+                if self._failures >= self.fail_max:
+                    self._opened_at = time.monotonic()
+        return False
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Erros de rede, 429 e 5xx valem nova tentativa; outros 4xx não."""
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+# backoff exponencial com jitter (0.5 s → 8 s) sobre o pool já aberto — as
+# novas tentativas não refazem o handshake TLS. Até 4 tentativas, e nenhuma
+# nova começa depois de 60 s (pior caso ≈ 60 s + um timeout de leitura).
+_retry_transient = retry(
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    stop=stop_after_attempt(4) | stop_after_delay(60),
+    retry=retry_if_exception(_is_transient),
+    reraise=True,
+)
+
+# O disjuntor fica dentro das funções com retry: cada tentativa conta como
+# uma falha, e com o circuito aberto o `CircuitOpenError` (não transitório)
+# encerra as novas tentativas na hora.
+_PPLX_BREAKER = CircuitBreaker("Perplexity API")
+
+
+@_retry_transient
+def _perplexity_post(headers: Mapping[str, str], payload: Dict[str, Any]) -> httpx.Response:
+    with _PPLX_BREAKER:
+        resp = _HTTP.post(
+            PERPLEXITY_CHAT_URL,
+            headers=headers,
+            content=orjson.dumps(payload),
+            timeout=_PPLX_TIMEOUT,
+        )
+        resp.raise_for_status()
+    return resp
+
+
+@_retry_transient
+async def _perplexity_apost(headers: Mapping[str, str], payload: Dict[str, Any]) -> httpx.Response:
+    with _PPLX_BREAKER:
+        resp = await _async_http().post(
+            PERPLEXITY_CHAT_URL,
+            headers=headers,
+            content=orjson.dumps(payload),
+            timeout=_PPLX_TIMEOUT,
+        )
+        resp.raise_for_status()
+    return resp
+
+
+@_retry_transient
+async def _perplexity_astream(headers: Mapping[str, str], payload: Dict[str, Any]) -> httpx.Response:
+    """
+    Abre o stream SSE (conexão + status HTTP) com retry e disjuntor.
+
+    Devolve a resposta ainda sem corpo lido; quem chama deve fechá-la
+    com `aclose()`.
+    """
+    client = _async_http()
+    request = client.build_request(
+        "POST", PERPLEXITY_CHAT_URL, headers=headers,
+        content=orjson.dumps(payload), timeout=_PPLX_TIMEOUT,
+    )
+    with _PPLX_BREAKER:
+        resp = await client.send(request, stream=True)
+        try:
+            resp.raise_for_status()
+        except httpx.HTTPStatusError:
+            await resp.aclose()
+            raise
+    return resp
+
+
+_PPLX_HEADERS: Mapping[str, str] = MappingProxyType({
+    "accept": "application/json",
+    "Content-Type": "application/json",
+    **({"Authorization": _PPLX_AUTH} if _PPLX_AUTH else {}),
+})
+_PPLX_STREAM_HEADERS: Mapping[str, str] = MappingProxyType(
+    {**_PPLX_HEADERS, "accept": "text/event-stream"}
+)
+# dict comum (o encoder JSON não aceita MappingProxyType); nunca é alterado
+_PPLX_SYS_MSG: Dict[str, str] = {
+    "role": "system",
+    "content": "Search the web and provide factual information with sources.",
+}
+
+
+def _perplexity_request(query: str, model: str) -> tuple[Mapping[str, str], Dict[str, Any]]:
+    """Headers + payload de uma chamada à Perplexity API (só a mensagem do usuário é nova)."""
+    if _PPLX_AUTH is None:
         raise RuntimeError("PERPLEXITY_API_KEY não definida no ambiente.")
 
-    headers = {
-        "accept": "application/json",
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
     payload = {
         "model": model,
-        "messages": [
-            {"role": "system", "content": "Search the web and provide factual information with sources."},
-            {"role": "user", "content": query},
-        ],
+        "messages": [_PPLX_SYS_MSG, {"role": "user", "content": query}],
     }
-    resp = requests.post(
-        "https://api.perplexity.ai/chat/completions",
-        headers=headers,
-        json=payload,
-        timeout=60,
-    )
-    resp.raise_for_status()
-    data = resp.json()
+    return _PPLX_HEADERS, payload
 
+
+def _perplexity_results(data: dict, perplexity_search_loop_count: int) -> Dict[str, Any]:
+    """Converte a resposta da Perplexity API no formato Tavily."""
     content = data["choices"][0]["message"]["content"]
     citations = data.get("citations", ["https://perplexity.ai"])
 
@@ -169,6 +555,104 @@ def perplexity_search(
 
 
 @traceable
+@cached_call(provider="perplexity")
+def perplexity_search(
+    query: str,
+    *,
+    model: str = "sonar",
+    perplexity_search_loop_count: int = 0,
+) -> Dict[str, Any]:
+    """
+    Busca usando a Perplexity API (pool HTTP compartilhado).
+
+    Necessita `PERPLEXITY_API_KEY` no ambiente.
+
+    Retorna estrutura de resultados similar à Tavily:
+        {'results': [ {'title', 'url', 'content', 'raw_content'}, ... ] }
+    """
+    headers, payload = _perplexity_request(query, model)
+    resp = _perplexity_post(headers, payload)
+    return _perplexity_results(orjson.loads(resp.content), perplexity_search_loop_count)
+
+
+@traceable
+@cached_call(provider="perplexity")
+async def perplexity_search_async(
+    query: str,
+    *,
+    model: str = "sonar",
+    perplexity_search_loop_count: int = 0,
+) -> Dict[str, Any]:
+    """Versão assíncrona de `perplexity_search` (mesmo formato de retorno)."""
+    headers, payload = _perplexity_request(query, model)
+    resp = await _perplexity_apost(headers, payload)
+    return _perplexity_results(orjson.loads(resp.content), perplexity_search_loop_count)
+
+
+@traceable
+async def perplexity_search_stream(
+    query: str,
+    *,
+    model: str = "sonar",
+    perplexity_search_loop_count: int = 0,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Versão em streaming de `perplexity_search` (SSE, `"stream": true`).
+
+    Os itens intermediários são só o texto novo de cada frame,
+    `{"delta": str}`; o último é a resposta completa no formato Tavily
+    (`{"results": [...]}`), montada uma vez ao fim do stream. Quem consome
+    pode começar a processar ~200 ms após o envio em vez de esperar a
+    geração inteira. Não passa pelo cache de buscas.
+
+    Só a abertura do stream tem retry; uma queda no meio da resposta
+    propaga o erro, já que parte do texto pode ter sido entregue.
+    """
+    _, payload = _perplexity_request(query, model)
+    headers = _PPLX_STREAM_HEADERS
+    payload["stream"] = True
+
+    buf = io.StringIO()
+    citations: List[str] | None = None
+    resp = await _perplexity_astream(headers, payload)
+    try:
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            frame = line[5:].strip()
+            if frame == "[DONE]":
+                break
+            chunk = orjson.loads(frame)
+            citations = chunk.get("citations") or citations
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if not delta:
+                continue
+            buf.write(delta)
+            yield {"delta": delta}
+    finally:
+        await resp.aclose()
+
+    if not buf.tell():
+        return
+    data: Dict[str, Any] = {"choices": [{"message": {"content": buf.getvalue()}}]}
+    if citations:
+        data["citations"] = citations
+    yield _perplexity_results(data, perplexity_search_loop_count)
+
+
+@functools.lru_cache(maxsize=1)
+def _op_client():
+    """Cliente OpenPerplex único por processo (SDK importado no primeiro uso)."""
+    if not _OP_KEY:
+        raise RuntimeError("OPENPERPLEX_API_KEY não definida no ambiente.")
+
+    from openperplex import OpenperplexSync
+
+    return OpenperplexSync(_OP_KEY)
+
+
+@traceable
+@cached_call(provider="openperplex")
 def openperplex_search(
     query: str,
     *,
@@ -181,12 +665,7 @@ def openperplex_search(
 
     Requer `OPENPERPLEX_API_KEY` no ambiente.
     """
-    key = os.getenv("OPENPERPLEX_API_KEY")
-    if not key:
-        raise RuntimeError("OPENPERPLEX_API_KEY não definida no ambiente.")
-
-    client = OpenperplexSync(key)
-    resp = client.search(
+    resp = _op_client().search(
         query=query,
         model=model,
         date_context="2024-08-25",
@@ -204,3 +683,177 @@ def openperplex_search(
         "content": resp["llm_response"],
         "sources": resp["sources"],
     }
+
+
+async def multi_search(query: str) -> Dict[str, Any]:
+    """
+    Consulta Tavily, Perplexity e OpenPerplex ao mesmo tempo.
+
+    O tempo total é o do provedor mais lento, não a soma dos três. O SDK
+    do OpenPerplex é síncrono e roda numa thread para não travar o loop.
+    Provedores que falharem (ex.: chave ausente) aparecem como `None`,
+    com o erro registrado no log.
+
+    Returns: {'tavily': ..., 'perplexity': ..., 'openperplex': ...}
+    """
+    names = ("tavily", "perplexity", "openperplex")
+    results = await asyncio.gather(
+        tavily_search_async(query),
+        perplexity_search_async(query),
+        asyncio.to_thread(openperplex_search, query),
+        return_exceptions=True,
+    )
+    out: Dict[str, Any] = {}
+    for name, res in zip(names, results):
+        if isinstance(res, Exception):
+            log.warning("%s falhou: %s", name, res)
+            res = None
+        out[name] = res
+    return out
+
+
+# --------------------------------------------------------------------------- #
+# Páginas                                                                     #
+# --------------------------------------------------------------------------- #
+
+_PAGE_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+_PAGE_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; local-perplexity)"}
+# O texto útil cabe de sobra nos primeiros KB; o resto só custaria parse.
+_PAGE_MAX_BYTES = 512 * 1024
+
+
+class _TextExtractor(HTMLParser):
+    """Extrai o texto visível de um HTML, ignorando scripts e navegação."""
+
+    _SKIP = {"script", "style", "noscript", "svg", "iframe", "nav", "header",
+             "footer", "aside", "form"}
+    _BLOCK = {"p", "div", "li", "br", "tr", "h1", "h2", "h3", "h4", "h5", "h6",
+              "section", "article", "blockquote", "pre"}
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self._skip_depth = 0
+        self._parts: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag in self._BLOCK:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self._BLOCK:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+
+def html_to_text(html: str) -> str:
+    """Texto principal de uma página HTML (uma linha por bloco)."""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+@cached_call(provider="page", exact=True)
+async def fetch_page_text_async(url: str) -> str | None:
+    """
+    Baixa `url` direto da origem e devolve o texto da página.
+
+    Lê no máximo `_PAGE_MAX_BYTES` e extrai o texto numa thread, para não
+    travar o gather das outras buscas. Retorna None se o download falhar
+    ou o conteúdo não for HTML — o chamador decide o fallback (ex.: o
+    trecho `content` do Tavily).
+    """
+    buf = bytearray()
+    try:
+        async with _async_http().stream(
+            "GET", url, headers=_PAGE_HEADERS, timeout=_PAGE_TIMEOUT,
+            follow_redirects=True,
+        ) as resp:
+            resp.raise_for_status()
+            if "html" not in resp.headers.get("content-type", ""):
+                return None
+            async for chunk in resp.aiter_bytes():
+                buf += chunk
+                if len(buf) >= _PAGE_MAX_BYTES:
+                    break
+            encoding = resp.encoding or "utf-8"
+    except httpx.HTTPError:
+        return None
+    html = buf[:_PAGE_MAX_BYTES].decode(encoding, errors="replace")
+    return (await asyncio.to_thread(html_to_text, html)).strip() or None
+
+
+# --------------------------------------------------------------------------- #
+# Ollama                                                                      #
+# --------------------------------------------------------------------------- #
+
+def ollama_preload(model: str, keep_alive: str = "30m") -> None:
+    """
+    Carrega `model` na memória do Ollama e o mantém residente por `keep_alive`.
+
+    Um `/api/generate` com prompt vazio só carrega os pesos, sem gerar nada;
+    a primeira pergunta do usuário deixa de pagar o tempo de carga.
+    """
+    resp = _HTTP.post(
+        f"{OLLAMA_URL}/api/generate",
+        json={"model": model, "prompt": "", "keep_alive": keep_alive},
+        timeout=httpx.Timeout(300.0, connect=5.0),  # carregar um 14B leva tempo
+    )
+    resp.raise_for_status()
+
+
+def ollama_installed_models() -> set[str]:
+    """Nomes dos modelos instalados no Ollama (`/api/tags`); vazio se indisponível."""
+    try:
+        resp = _HTTP.get(f"{OLLAMA_URL}/api/tags", timeout=httpx.Timeout(5.0))
+        resp.raise_for_status()
+    except httpx.HTTPError:
+        return set()
+    return {m["name"] for m in resp.json().get("models", [])}
+
+
+def embed_batch(texts: List[str], model: str = EMBED_MODEL) -> np.ndarray:
+    """
+    Embeddings de todos os `texts` numa única chamada a `/api/embed`.
+
+    Returns: matriz float32 (len(texts) × dim), na mesma ordem da entrada.
+    """
+    resp = _HTTP.post(
+        f"{OLLAMA_URL}/api/embed",
+        json={"model": model, "input": texts},
+        timeout=httpx.Timeout(120.0, connect=5.0),
+    )
+    resp.raise_for_status()
+    return np.asarray(resp.json()["embeddings"], dtype=np.float32)
+
+
+def drop_near_duplicates(
+    results: List[dict],
+    vectors: np.ndarray,
+    threshold: float = 0.95,
+) -> List[dict]:
+    """
+    Remove resultados cujo embedding tem cosseno ≥ `threshold` com algum
+    resultado anterior já mantido (mesmo texto em páginas diferentes).
+
+    `vectors[i]` é o embedding de `results[i]`.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+    sims = unit @ unit.T
+
+    kept: List[int] = []
+    for i in range(len(results)):
+        if all(sims[i, j] < threshold for j in kept):
+            kept.append(i)
+    return [results[i] for i in kept]